@@ -3,61 +3,231 @@
 Frame processing functions for the motion detection project.
 """
 
+import queue
+import threading
+
 import cv2
 import numpy as np
 
 
-def process_video(video_path, target_fps=5, resize_dim=(1280, 720)):
+def cuda_decoding_available():
+    """Check whether OpenCV was built with CUDA video decoding and a GPU is present."""
+    try:
+        return hasattr(cv2, "cudacodec") and cv2.cuda.getCudaEnabledDeviceCount() > 0
+    except cv2.error:
+        return False
+
+
+def _resize_interpolation(source_size, resize_dim):
+    """
+    Pick the interpolation for resizing frames of one fixed size to another.
+
+    Args:
+        source_size: Decoded frame size (width, height)
+        resize_dim: Target frame size (width, height)
+
+    Returns:
+        INTER_AREA when shrinking, INTER_LINEAR when enlarging, or None if
+        the frames already have the target size
+    """
+    if tuple(source_size) == tuple(resize_dim):
+        return None
+    if source_size[0] >= resize_dim[0] and source_size[1] >= resize_dim[1]:
+        return cv2.INTER_AREA
+    return cv2.INTER_LINEAR
+
+
+def process_video(video_path, target_fps=5, resize_dim=(1280, 720), backend="cpu"):
     """
     Extract frames from a video at a specified frame rate.
 
+    Frames are yielded one at a time so that only the frame currently being
+    processed has to be kept in memory.
+
     Args:
         video_path: Path to the video file
         target_fps: Target frames per second to extract
         resize_dim: Dimensions to resize frames to (width, height)
+        backend: "cpu" to decode with cv2.VideoCapture, or "cuda" to decode
+                 and resize on the GPU (falls back to "cpu" if unavailable)
 
-    Returns:
-        List of extracted frames
+    Yields:
+        Extracted frames, resized to resize_dim
     """
-    frames = []
-    
     # Open the video file
     cap = cv2.VideoCapture(video_path)
     
     if not cap.isOpened():
         print(f"Error: Could not open video file {video_path}")
-        return frames
+        return
     
     # Get video properties
     original_fps = cap.get(cv2.CAP_PROP_FPS)
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    source_size = (
+        int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+    )
     
     print(f"Video FPS: {original_fps}, Total frames: {total_frames}")
     print(f"Target FPS: {target_fps}")
     
     # Calculate frame interval for target FPS
     frame_interval = int(original_fps / target_fps) if target_fps < original_fps else 1
+
+    # The input size is fixed for the whole video, so decide once whether and
+    # how frames need resizing instead of on every frame
+    interpolation = _resize_interpolation(source_size, resize_dim)
+
+    if backend == "cuda":
+        if cuda_decoding_available():
+            cap.release()
+            yield from _process_video_cuda(
+                video_path, frame_interval, resize_dim, interpolation
+            )
+            return
+        print("CUDA video decoding is not available, using CPU decoding")
     
     frame_count = 0
     extracted_count = 0
     
-    while True:
-        ret, frame = cap.read()
-        
-        if not ret:
-            break
+    try:
+        while True:
+            # Only advance the demuxer here; frames we skip are never retrieved,
+            # which saves the colour conversion and copy for every dropped frame.
+            # Note that inter-coded streams (H.264/HEVC P/B-frames) still have to
+            # be decoded internally, so the saving is largest for intra-only codecs.
+            if not cap.grab():
+                break
+            
+            # Extract frame at specified interval
+            if frame_count % frame_interval == 0:
+                ret, frame = cap.retrieve()
+                if not ret:
+                    break
+
+                # Resize frame
+                if interpolation is not None:
+                    frame = cv2.resize(frame, resize_dim, interpolation=interpolation)
+                yield frame
+                extracted_count += 1
             
+            frame_count += 1
+    finally:
+        cap.release()
+
+    print(f"Extracted {extracted_count} frames from {frame_count} total frames")
+
+
+def _process_video_cuda(video_path, frame_interval, resize_dim, interpolation):
+    """
+    Decode and resize frames on the GPU with OpenCV's NVDEC-backed reader.
+
+    Frames are downloaded to host memory only after resizing, since motion
+    detection and drawing run on the CPU. The resize target buffer and CUDA
+    stream are created once and reused for every frame.
+
+    Args:
+        video_path: Path to the video file
+        frame_interval: Keep every frame_interval-th frame
+        resize_dim: Dimensions to resize frames to (width, height)
+        interpolation: Interpolation from _resize_interpolation, or None to
+                       skip resizing
+
+    Yields:
+        Extracted frames, resized to resize_dim
+    """
+    reader = cv2.cudacodec.createVideoReader(video_path)
+    try:
+        reader.set(cv2.cudacodec.ColorFormat_BGR)
+    except (AttributeError, cv2.error):
+        # Older builds always decode to BGRA; converted below
+        pass
+
+    stream = cv2.cuda.Stream()
+    gpu_resized = cv2.cuda_GpuMat(resize_dim[1], resize_dim[0], cv2.CV_8UC3)
+
+    frame_count = 0
+    extracted_count = 0
+
+    while reader.grab():
         # Extract frame at specified interval
         if frame_count % frame_interval == 0:
-            # Resize frame
-            resized_frame = cv2.resize(frame, resize_dim)
-            frames.append(resized_frame)
+            ret, gpu_frame = reader.retrieve()
+            if not ret:
+                break
+
+            if gpu_frame.channels() == 4:
+                gpu_frame = cv2.cuda.cvtColor(gpu_frame, cv2.COLOR_BGRA2BGR, stream=stream)
+
+            # Resize on the device and copy only the small frame back
+            if interpolation is not None:
+                cv2.cuda.resize(gpu_frame, resize_dim, dst=gpu_resized,
+                                interpolation=interpolation, stream=stream)
+                gpu_frame = gpu_resized
+            frame = gpu_frame.download(stream=stream)
+            stream.waitForCompletion()
+
+            yield frame
             extracted_count += 1
-            
+
         frame_count += 1
-    
-    cap.release()
+
     print(f"Extracted {extracted_count} frames from {frame_count} total frames")
-    
-    return frames
 
+
+def prefetch_frames(frames, prefetch=8):
+    """
+    Decode frames on a background thread ahead of the consumer.
+
+    The reader thread pushes frames into a bounded queue, so decoding overlaps
+    with the processing of earlier frames while at most `prefetch` frames are
+    buffered at any time.
+
+    Args:
+        frames: Iterable of frames, typically from process_video
+        prefetch: Maximum number of frames to decode ahead
+
+    Yields:
+        Frames in their original order
+    """
+    read_q = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def reader():
+        try:
+            for frame in frames:
+                if stop.is_set():
+                    break
+                read_q.put(frame)
+        except Exception as exc:
+            read_q.put(exc)
+        finally:
+            # Release the video file even if the consumer stopped early
+            close = getattr(frames, "close", None)
+            if close is not None:
+                close()
+        # Sentinel to signal the end of the stream
+        read_q.put(None)
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            frame = read_q.get()
+            if frame is None:
+                break
+            if isinstance(frame, Exception):
+                raise frame
+            yield frame
+    finally:
+        # If the consumer stopped early, tell the reader to stop and drain the
+        # queue so it is not left blocked on a full queue
+        stop.set()
+        while thread.is_alive():
+            try:
+                read_q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        thread.join()
@@ -1,10 +1,11 @@
 import os
 import argparse
+import itertools
 import cv2
 import numpy as np
 
-from frame_processor import process_video
-from motion_detector import detect_motion
+from frame_processor import prefetch_frames, process_video
+from motion_detector import detect_motion_parallel, detect_motion_stream
 from viewport_tracker import track_viewport
 from visualizer import visualize_results
 
@@ -25,6 +26,30 @@ def parse_args():
         default="720x480",
         help="Size of viewport in format WIDTHxHEIGHT",
     )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of threads for motion detection (1 runs it serially)",
+    )
+    parser.add_argument(
+        "--backend",
+        type=str,
+        default="cpu",
+        choices=["cpu", "cuda"],
+        help="Decode frames on the CPU or on an NVIDIA GPU",
+    )
+    parser.add_argument(
+        "--codec",
+        type=str,
+        default="libx264",
+        help="ffmpeg video encoder for the outputs, e.g. h264_nvenc on NVIDIA GPUs",
+    )
+    parser.add_argument(
+        "--save_frames",
+        action="store_true",
+        help="Also save every visualized frame as a JPEG image",
+    )
     return parser.parse_args()
 
 
@@ -33,6 +58,9 @@ def main():
     # Parse arguments
     args = parse_args()
 
+    # Frames are resized to this size before any processing
+    frame_size = (1280, 720)
+
     # Parse viewport size
     try:
         viewport_width, viewport_height = map(int, args.viewport_size.split("x"))
@@ -43,31 +71,72 @@ def main():
         )
         viewport_size = (720, 480)
 
+    # The viewport is cropped from the resized frames, so it cannot be larger
+    if viewport_size[0] > frame_size[0] or viewport_size[1] > frame_size[1]:
+        clamped_size = (
+            min(viewport_size[0], frame_size[0]),
+            min(viewport_size[1], frame_size[1]),
+        )
+        print(
+            f"Viewport size {viewport_size[0]}x{viewport_size[1]} is larger than "
+            f"the {frame_size[0]}x{frame_size[1]} frames. "
+            f"Using {clamped_size[0]}x{clamped_size[1]}."
+        )
+        viewport_size = clamped_size
+
+    # OpenCV splits individual calls across its own threads. When detection
+    # already runs on a thread pool, that oversubscribes the cores and can be
+    # slower than single-threaded calls, so only let OpenCV use every core when
+    # detection is serial. CV_THREADS overrides the choice.
+    if "CV_THREADS" in os.environ:
+        cv2.setNumThreads(int(os.environ["CV_THREADS"]))
+    else:
+        cv2.setNumThreads(1 if args.jobs > 1 else os.cpu_count())
+
     # Create output directory if it doesn't exist
     os.makedirs(args.output, exist_ok=True)
 
     print(f"Processing video: {args.video}")
 
+    # The steps below are lazy generators: frames are decoded on a reader
+    # thread, detected on a thread pool, drawn on this thread, and encoded on
+    # writer threads inside visualize_results. The tees are consumed in
+    # lockstep, so they only buffer the few frames detection works ahead on.
+
     # Step 1: Extract frames from video
-    frames = process_video(args.video, args.fps)
-    print(f"Extracted {len(frames)} frames")
+    decoded_frames = prefetch_frames(
+        process_video(args.video, args.fps, frame_size, backend=args.backend)
+    )
+    frames, detection_frames = itertools.tee(decoded_frames)
 
     # Step 2: Detect motion in frames
-    motion_results = []
-    for i, frame in enumerate(frames):
-        print(f"Processing frame {i + 1}/{len(frames)}")
-
-        # Pass the entire frames list and the current index to detect_motion
-        motion_boxes = detect_motion(frames, i)
-        motion_results.append(motion_boxes)
+    if args.jobs > 1:
+        detections = detect_motion_parallel(detection_frames, n_jobs=args.jobs)
+    else:
+        detections = detect_motion_stream(detection_frames)
+    motion_results, tracking_results = itertools.tee(detections)
 
     # Step 3: Track viewport based on motion detection
-    viewport_positions = track_viewport(frames, motion_results, viewport_size)
+    frame_shape = (frame_size[1], frame_size[0])
+    viewport_positions = track_viewport(tracking_results, frame_shape, viewport_size)
 
     # Step 4: Visualize and save results
-    visualize_results(
-        frames, motion_results, viewport_positions, viewport_size, args.output
-    )
+    try:
+        visualize_results(
+            frames,
+            motion_results,
+            viewport_positions,
+            viewport_size,
+            args.output,
+            save_frames=args.save_frames,
+            codec=args.codec,
+        )
+    finally:
+        # Shut down the detection pool and reader thread if visualization
+        # stopped before the end of the video
+        if hasattr(detections, "close"):
+            detections.close()
+        decoded_frames.close()
 
     print(f"Processing complete. Results saved to {args.output}")
 
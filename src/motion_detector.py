@@ -3,57 +3,277 @@
 Motion detection functions for the sports video analysis project.
 """
 
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
 import numpy as np
 
+# Motion is detected on frames downscaled by this factor in each dimension.
+# Only box centres are used downstream, so the lost detail does not matter.
+DETECTION_SCALE = 4
+
+# Structuring element for filling holes in the motion mask, built once
+_DILATE_KERNEL = np.ones((5, 5), np.uint8)
+
+# Upper bound on the frames detect_motion_parallel holds ahead of its
+# consumer, whatever the thread count; each decoded 720p frame is ~2.7 MB
+_MAX_LOOKAHEAD = 16
+
+
+def preprocess_frame(frame):
+    """
+    Convert a frame to the blurred grayscale image used for differencing.
+
+    Args:
+        frame: BGR video frame
+
+    Returns:
+        Blurred grayscale frame, downscaled by DETECTION_SCALE
+    """
+    height, width = frame.shape[:2]
+    small = cv2.resize(
+        frame,
+        (width // DETECTION_SCALE, height // DETECTION_SCALE),
+        interpolation=cv2.INTER_AREA,
+    )
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    # Blur to reduce noise. Two 5x5 box filters approximate a Gaussian and
+    # stay on OpenCV's fast small-kernel path, unlike a 21x21 GaussianBlur;
+    # the hard threshold that follows does not need an exact Gaussian.
+    return cv2.blur(cv2.blur(gray, (5, 5)), (5, 5))
+
+
+def difference_mask(gray_prev, gray_current, threshold=25):
+    """
+    Threshold the difference between two preprocessed frames.
+
+    Args:
+        gray_prev: Preprocessed previous frame
+        gray_current: Preprocessed current frame
+        threshold: Threshold for frame difference detection
+
+    Returns:
+        Binary mask (0/255) of pixels that changed
+    """
+    # Calculate absolute difference between frames
+    frame_diff = cv2.absdiff(gray_prev, gray_current)
+
+    # Apply threshold to highlight differences
+    _, thresh = cv2.threshold(frame_diff, threshold, 255, cv2.THRESH_BINARY)
+    return thresh
+
+
+def find_motion_boxes(prev_mask, current_mask, min_area=100):
+    """
+    Find motion regions using three-frame differencing.
+
+    A pixel of frame k counts as moving only if it changed both between
+    frames k-1 and k and between frames k and k+1. Intersecting the two
+    difference masks suppresses flicker and the "ghost" left where an object
+    used to be or is about to be, so the regions found are where the objects
+    are in frame k.
+
+    Args:
+        prev_mask: Difference mask between frames k-1 and k
+        current_mask: Difference mask between frames k and k+1
+        min_area: Minimum region area to consider, in full resolution pixels
+
+    Returns:
+        List of bounding boxes for detected motion regions, in full
+        resolution coordinates
+    """
+    # Keep only pixels that changed in both frame pairs
+    thresh = cv2.bitwise_and(prev_mask, current_mask)
+
+    # Dilate the thresholded image to fill in holes
+    thresh = cv2.dilate(thresh, _DILATE_KERNEL, iterations=2)
+
+    # Label connected regions; only their bounding boxes and areas are needed,
+    # which connectedComponentsWithStats gives in a single pass without
+    # tracing contours
+    _, _, stats, _ = cv2.connectedComponentsWithStats(thresh, connectivity=8)
+
+    # Filter regions by area (row 0 is the background) and extract bounding
+    # boxes, scaling both back to full resolution
+    scale = DETECTION_SCALE
+    stats = stats[1:]
+    keep = stats[:, cv2.CC_STAT_AREA] > min_area / (scale * scale)
+    boxes = stats[keep][:, [cv2.CC_STAT_LEFT, cv2.CC_STAT_TOP,
+                            cv2.CC_STAT_WIDTH, cv2.CC_STAT_HEIGHT]] * scale
+
+    return [tuple(box) for box in boxes.tolist()]
+
+
 def detect_motion(frames, frame_idx, threshold=25, min_area=100):
     """
-    Detect motion in the current frame by comparing with previous frame.
+    Detect motion in the current frame by comparing with its neighbouring frames.
 
     Args:
         frames: List of video frames
         frame_idx: Index of the current frame
         threshold: Threshold for frame difference detection
-        min_area: Minimum contour area to consider
+        min_area: Minimum motion region area to consider
 
     Returns:
         List of bounding boxes for detected motion regions
     """
-    # We need at least 2 frames to detect motion
-    if frame_idx < 1 or frame_idx >= len(frames):
+    # We need a frame before and after the current one to detect motion
+    if frame_idx < 1 or frame_idx >= len(frames) - 1:
         return []
 
-    # Get current and previous frame
-    current_frame = frames[frame_idx]
-    prev_frame = frames[frame_idx - 1]
-
-    # Convert frames to grayscale
-    gray_current = cv2.cvtColor(current_frame, cv2.COLOR_BGR2GRAY)
-    gray_prev = cv2.cvtColor(prev_frame, cv2.COLOR_BGR2GRAY)
-    
-    # Apply Gaussian blur to reduce noise
-    gray_current = cv2.GaussianBlur(gray_current, (21, 21), 0)
-    gray_prev = cv2.GaussianBlur(gray_prev, (21, 21), 0)
-    
-    # Calculate absolute difference between frames
-    frame_diff = cv2.absdiff(gray_prev, gray_current)
-    
-    # Apply threshold to highlight differences
-    _, thresh = cv2.threshold(frame_diff, threshold, 255, cv2.THRESH_BINARY)
-    
-    # Dilate the thresholded image to fill in holes
-    kernel = np.ones((5, 5), np.uint8)
-    thresh = cv2.dilate(thresh, kernel, iterations=2)
-    
-    # Find contours in the thresholded image
-    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    
-    # Filter contours by area and extract bounding boxes
-    motion_boxes = []
-    for contour in contours:
-        area = cv2.contourArea(contour)
-        if area > min_area:
-            x, y, w, h = cv2.boundingRect(contour)
-            motion_boxes.append((x, y, w, h))
-    
-    return motion_boxes
\ No newline at end of file
+    # Convert the previous, current and next frames to blurred grayscale
+    gray_prev, gray_current, gray_next = (
+        preprocess_frame(frame) for frame in frames[frame_idx - 1:frame_idx + 2]
+    )
+
+    return find_motion_boxes(
+        difference_mask(gray_prev, gray_current, threshold),
+        difference_mask(gray_current, gray_next, threshold),
+        min_area,
+    )
+
+
+def detect_motion_stream(frames, threshold=25, min_area=100):
+    """
+    Detect motion for a stream of frames on the calling thread.
+
+    Args:
+        frames: Iterable of video frames
+        threshold: Threshold for frame difference detection
+        min_area: Minimum motion region area to consider
+
+    Yields:
+        Motion detection results for each frame, in order
+    """
+    detector = MotionDetector(threshold, min_area)
+    frames = iter(frames)
+    first = next(frames, None)
+    if first is None:
+        return
+
+    # The detector reports each frame once it has seen the frame after it
+    detector(first)
+    for frame in frames:
+        yield detector(frame)
+
+    # The last frame has no successor to compare against
+    yield []
+
+
+def detect_motion_parallel(frames, threshold=25, min_area=100, n_jobs=None):
+    """
+    Detect motion for a stream of frames on a thread pool.
+
+    Each frame is converted and blurred once, each consecutive pair is
+    differenced once, and each frame then intersects the masks it shares
+    with its neighbours. Every step runs as a pool task as soon as the frames
+    it needs have been read, so up to 2 * n_jobs frames (at most 16) are
+    processed ahead of the consumer while results are still yielded in order.
+    A frame's result is only yielded once no task reads the frame any more,
+    so the consumer may draw on it. OpenCV releases the GIL inside its C++
+    routines, which lets the threads run concurrently.
+
+    Args:
+        frames: Iterable of video frames
+        threshold: Threshold for frame difference detection
+        min_area: Minimum motion region area to consider
+        n_jobs: Number of worker threads (defaults to the CPU count)
+
+    Yields:
+        Motion detection results for each frame, same as detect_motion_stream
+    """
+    n_jobs = n_jobs or os.cpu_count()
+    lookahead = min(2 * n_jobs, _MAX_LOOKAHEAD)
+
+    # Tasks wait on futures submitted before them. The pool runs tasks in
+    # submission order, so those are always running or done already.
+    def pair_mask(prev_blur, blur):
+        return difference_mask(prev_blur.result(), blur.result(), threshold)
+
+    def motion_boxes(prev_mask, mask):
+        return find_motion_boxes(prev_mask.result(), mask.result(), min_area)
+
+    def no_motion(blur):
+        blur.result()
+        return []
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        pending = deque()
+        prev_blur = None
+        prev_mask = None
+
+        for frame in frames:
+            blur = executor.submit(preprocess_frame, frame)
+            mask = None
+            if prev_blur is None:
+                # The first frame has no predecessor to compare against
+                pending.append(executor.submit(no_motion, blur))
+            else:
+                mask = executor.submit(pair_mask, prev_blur, blur)
+            if prev_mask is not None:
+                # Boxes for the previous frame, now that its successor is here
+                pending.append(executor.submit(motion_boxes, prev_mask, mask))
+            prev_blur, prev_mask = blur, mask
+
+            if len(pending) > lookahead:
+                yield pending.popleft().result()
+
+        # The last frame has no successor to compare against
+        if prev_mask is not None:
+            pending.append(executor.submit(no_motion, prev_blur))
+
+        while pending:
+            yield pending.popleft().result()
+
+
+class MotionDetector:
+    """
+    Stateful motion detector for a stream of frames.
+
+    Motion in a frame is found from the frames on either side of it, so
+    results lag the input by one: each call returns the boxes for the frame
+    passed in the call before. Only the preprocessed previous frame and the
+    previous difference mask are retained between calls, so each frame is
+    converted, blurred and differenced exactly once.
+    """
+
+    def __init__(self, threshold=25, min_area=100):
+        """
+        Args:
+            threshold: Threshold for frame difference detection
+            min_area: Minimum motion region area to consider
+        """
+        self.threshold = threshold
+        self.min_area = min_area
+        self.prev_gray = None
+        self.prev_mask = None
+
+    def __call__(self, frame):
+        """
+        Add a frame and detect motion in the frame seen before it.
+
+        Args:
+            frame: Current BGR video frame
+
+        Returns:
+            List of bounding boxes for detected motion regions in the
+            previous frame
+        """
+        prev_gray = self.prev_gray
+        self.prev_gray = preprocess_frame(frame)
+
+        # We need at least 2 frames to compute a difference mask
+        if prev_gray is None:
+            return []
+        mask = difference_mask(prev_gray, self.prev_gray, self.threshold)
+
+        prev_mask, self.prev_mask = self.prev_mask, mask
+
+        # The first frame has no predecessor to compare against
+        if prev_mask is None:
+            return []
+
+        return find_motion_boxes(prev_mask, mask, self.min_area)
@@ -23,66 +23,80 @@ def calculate_region_of_interest(motion_boxes, frame_shape):
         height, width = frame_shape[:2]
         return (width // 2, height // 2, 0, 0)
 
+    # Fast paths: one or two motion regions are by far the most common case,
+    # and plain integer arithmetic beats building NumPy arrays for them
+    if len(motion_boxes) == 1:
+        x, y, w, h = motion_boxes[0]
+        if w * h > 0:
+            return (x + w // 2, y + h // 2, w, h)
+    elif len(motion_boxes) == 2:
+        (x1, y1, w1, h1), (x2, y2, w2, h2) = motion_boxes
+        area1 = w1 * h1
+        area2 = w2 * h2
+        total_weight = area1 + area2
+        if total_weight > 0:
+            avg_x = ((x1 + w1 // 2) * area1 + (x2 + w2 // 2) * area2) // total_weight
+            avg_y = ((y1 + h1 // 2) * area1 + (y2 + h2 // 2) * area2) // total_weight
+            if area2 > area1:
+                return (avg_x, avg_y, w2, h2)
+            return (avg_x, avg_y, w1, h1)
+
     # Strategy: Use weighted average of all motion boxes
     # Larger boxes get more weight in determining the center
-    total_weight = 0
-    weighted_x = 0
-    weighted_y = 0
-    
-    for x, y, w, h in motion_boxes:
-        # Calculate center of the box
-        center_x = x + w // 2
-        center_y = y + h // 2
-        
-        # Use area as weight (larger motion regions are more important)
-        weight = w * h
-        
-        weighted_x += center_x * weight
-        weighted_y += center_y * weight
-        total_weight += weight
-    
+    # Pixel coordinates and areas of a frame fit in int32; only the weighted
+    # sums need int64
+    boxes = np.asarray(motion_boxes, dtype=np.int32)
+    x, y, w, h = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+
+    # Use area as weight (larger motion regions are more important)
+    area = w * h
+    total_weight = area.sum(dtype=np.int64)
+
     if total_weight > 0:
-        # Calculate weighted average center
-        avg_x = int(weighted_x / total_weight)
-        avg_y = int(weighted_y / total_weight)
+        # Calculate weighted average of the box centers
+        avg_x = int(np.multiply(x + w // 2, area, dtype=np.int64).sum() // total_weight)
+        avg_y = int(np.multiply(y + h // 2, area, dtype=np.int64).sum() // total_weight)
         
         # Return center coordinates and dimensions (using largest box for reference)
-        largest_box = max(motion_boxes, key=lambda box: box[2] * box[3])
-        return (avg_x, avg_y, largest_box[2], largest_box[3])
+        largest_box = boxes[area.argmax()]
+        return (avg_x, avg_y, int(largest_box[2]), int(largest_box[3]))
     else:
         height, width = frame_shape[:2]
         return (width // 2, height // 2, 0, 0)
 
 
-def track_viewport(frames, motion_results, viewport_size, smoothing_factor=0.3):
+def track_viewport(motion_results, frame_shape, viewport_size, smoothing_factor=0.3):
     """
     Track viewport position across frames with smoothing.
 
+    Positions are produced online, so motion_results may be a generator that
+    is still being filled by the motion detector.
+
     Args:
-        frames: List of video frames
-        motion_results: List of motion detection results for each frame
+        motion_results: Iterable of motion detection results for each frame
+        frame_shape: Shape of the video frames (height, width)
         viewport_size: Tuple (width, height) of the viewport
         smoothing_factor: Factor for smoothing viewport movement (0-1)
                           Lower values create smoother movement
 
-    Returns:
-        List of viewport positions for each frame as (x, y) center coordinates
+    Yields:
+        Viewport position for each frame as (x, y) center coordinates
     """
-    viewport_positions = []
-
-    # Initialize with center of first frame if available
-    if not frames:
-        return []
-    
-    height, width = frames[0].shape[:2]
+    height, width = frame_shape[:2]
     vp_width, vp_height = viewport_size
+
+    # Bounds that keep the viewport within the frame, fixed for the whole video
+    min_x = vp_width // 2
+    max_x = width - vp_width // 2
+    min_y = vp_height // 2
+    max_y = height - vp_height // 2
     
     # Initialize previous position with frame center
     prev_x, prev_y = width // 2, height // 2
 
     for i, motion_boxes in enumerate(motion_results):
         # Calculate region of interest for current frame
-        roi_x, roi_y, _, _ = calculate_region_of_interest(motion_boxes, frames[i].shape)
+        roi_x, roi_y, _, _ = calculate_region_of_interest(motion_boxes, frame_shape)
         
         # Apply smoothing using exponential moving average
         if i == 0:
@@ -95,20 +109,18 @@ def track_viewport(frames, motion_results, viewport_size, smoothing_factor=0.3):
             smooth_y = int(prev_y * (1 - smoothing_factor) + roi_y * smoothing_factor)
         
         # Ensure viewport stays within frame boundaries
-        # Adjust X coordinate
-        min_x = vp_width // 2
-        max_x = width - vp_width // 2
-        smooth_x = max(min_x, min(max_x, smooth_x))
-        
-        # Adjust Y coordinate
-        min_y = vp_height // 2
-        max_y = height - vp_height // 2
-        smooth_y = max(min_y, min(max_y, smooth_y))
+        # (inline comparisons avoid two min/max calls per coordinate)
+        if smooth_x > max_x:
+            smooth_x = max_x
+        if smooth_x < min_x:
+            smooth_x = min_x
+        if smooth_y > max_y:
+            smooth_y = max_y
+        if smooth_y < min_y:
+            smooth_y = min_y
         
-        # Store viewport center position
-        viewport_positions.append((smooth_x, smooth_y))
+        # Emit viewport center position
+        yield (smooth_x, smooth_y)
         
         # Update previous position for next iteration
         prev_x, prev_y = smooth_x, smooth_y
-
-    return viewport_positions
@@ -4,97 +4,289 @@ Visualization functions for displaying motion detection and viewport tracking re
 """
 
 import os
+import queue
+import shutil
+import subprocess
+import threading
+
 import cv2
 import numpy as np
 
 
-def visualize_results(frames, motion_results, viewport_positions, viewport_size, output_dir):
+# JPEG quality for the optional per-frame image dumps
+JPEG_PARAMS = [cv2.IMWRITE_JPEG_QUALITY, 80]
+
+
+class FFmpegWriter:
+    """
+    Video writer that pipes raw BGR frames into an ffmpeg subprocess.
+
+    Encoding happens in the ffmpeg process, so it runs in parallel with the
+    Python side and can use H.264 encoders such as libx264 or the NVENC
+    hardware encoder (h264_nvenc). Exposes the same write/release interface
+    as cv2.VideoWriter.
+    """
+
+    def __init__(self, path, fps, frame_size, codec="libx264"):
+        """
+        Args:
+            path: Output video path
+            fps: Frame rate of the output video
+            frame_size: Tuple (width, height) of the frames
+            codec: ffmpeg video encoder name
+        """
+        width, height = frame_size
+        preset = "p1" if codec.endswith("_nvenc") else "veryfast"
+        self.proc = subprocess.Popen(
+            [
+                "ffmpeg", "-loglevel", "error", "-y",
+                "-f", "rawvideo", "-pix_fmt", "bgr24",
+                "-s", f"{width}x{height}", "-r", str(fps),
+                "-i", "-",
+                "-c:v", codec, "-preset", preset, "-pix_fmt", "yuv420p",
+                # yuv420p needs even dimensions; pad odd sizes by one pixel
+                "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+                path,
+            ],
+            stdin=subprocess.PIPE,
+        )
+        # A bad codec or output path only makes ffmpeg exit once it has
+        # started; write() and release() detect that and raise
+
+    def _raise_exited(self):
+        raise RuntimeError(
+            f"ffmpeg exited with status {self.proc.wait()} (see its error output above)"
+        )
+
+    def write(self, frame):
+        """Send one BGR frame to the encoder."""
+        # ffmpeg only sets up the encoder once the first frame arrives, so
+        # problems such as an unavailable codec show up as an exited process
+        if self.proc.poll() is not None:
+            self._raise_exited()
+        try:
+            self.proc.stdin.write(np.ascontiguousarray(frame).data)
+        except BrokenPipeError:
+            self._raise_exited()
+
+    def release(self):
+        """Close the pipe and wait for ffmpeg to finish the file."""
+        try:
+            self.proc.stdin.close()
+        except BrokenPipeError:
+            # ffmpeg already exited; its status is checked below
+            pass
+        if self.proc.wait() != 0:
+            self._raise_exited()
+
+
+def _open_video_writer(path, fps, frame_size, codec):
+    """
+    Open an ffmpeg-backed writer, or OpenCV's mp4v writer if ffmpeg is missing.
+
+    Args:
+        path: Output video path
+        fps: Frame rate of the output video
+        frame_size: Tuple (width, height) of the frames
+        codec: ffmpeg video encoder name
+
+    Returns:
+        Object with write(frame) and release() methods
+    """
+    if shutil.which("ffmpeg"):
+        return FFmpegWriter(path, fps, frame_size, codec)
+
+    print(f"ffmpeg is not available, encoding {path} with OpenCV's mp4v instead of {codec}")
+    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+    return cv2.VideoWriter(path, fourcc, fps, frame_size)
+
+
+class _WriterThread:
+    """
+    Thread that feeds frames from a bounded queue to a video writer.
+
+    Queue items are (frame, image_path) tuples. When image_path is set the
+    frame is also saved as a JPEG, so the disk I/O happens off the main thread.
+
+    If writing fails the error is stored and the thread keeps draining the
+    queue, so the producer never blocks on a full queue; the error is raised
+    again on the producer's next put() or from check().
+    """
+
+    def __init__(self, video_writer, prefetch):
+        """
+        Args:
+            video_writer: Opened video writer
+            prefetch: Maximum number of frames waiting to be encoded
+        """
+        self.video_writer = video_writer
+        self.write_q = queue.Queue(maxsize=prefetch)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.write_q.get()
+            if item is None:
+                break
+            if self.error is not None:
+                continue
+            frame, image_path = item
+            try:
+                self.video_writer.write(frame)
+                if image_path is not None:
+                    cv2.imwrite(image_path, frame, JPEG_PARAMS)
+            except Exception as exc:
+                self.error = exc
+
+    def put(self, frame, image_path=None):
+        """Queue a frame for writing, raising any earlier write error."""
+        self.check()
+        self.write_q.put((frame, image_path))
+
+    def close(self):
+        """Let the thread finish the queued frames and wait for it to exit."""
+        self.write_q.put(None)
+        self.thread.join()
+
+    def check(self):
+        """Raise the error the thread hit while writing, if any."""
+        if self.error is not None:
+            raise self.error
+
+
+def visualize_results(frames, motion_results, viewport_positions, viewport_size, output_dir,
+                      prefetch=8, save_frames=False, codec="libx264"):
     """
     Create visualization of motion detection and viewport tracking results.
 
+    The inputs are consumed in lockstep and each frame is written out as soon
+    as it has been drawn, so they may all be generators.
+
     Args:
-        frames: List of video frames
-        motion_results: List of motion detection results for each frame
-        viewport_positions: List of viewport center positions for each frame
+        frames: Iterable of video frames
+        motion_results: Iterable of motion detection results for each frame
+        viewport_positions: Iterable of viewport center positions for each frame
         viewport_size: Tuple (width, height) of the viewport
         output_dir: Directory to save visualization results
+        prefetch: Maximum number of frames queued for each video writer
+        save_frames: Also save every frame as a JPEG image (slow on long videos)
+        codec: ffmpeg video encoder, e.g. "h264_nvenc" to encode on the GPU
     """
-    # Create output directory for frames
     frames_dir = os.path.join(output_dir, "frames")
-    os.makedirs(frames_dir, exist_ok=True)
-
     viewport_dir = os.path.join(output_dir, "viewport")
-    os.makedirs(viewport_dir, exist_ok=True)
+    if save_frames:
+        # Create output directories for frames
+        os.makedirs(frames_dir, exist_ok=True)
+        os.makedirs(viewport_dir, exist_ok=True)
 
-    # Get dimensions for the output video
-    height, width = frames[0].shape[:2]
-
-    # Create video writers
-    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
     video_path = os.path.join(output_dir, "motion_detection.mp4")
-    video_writer = cv2.VideoWriter(video_path, fourcc, 5, (width, height))
-
     viewport_video_path = os.path.join(output_dir, "viewport_tracking.mp4")
     vp_width, vp_height = viewport_size
-    viewport_writer = cv2.VideoWriter(
-        viewport_video_path, fourcc, 5, (vp_width, vp_height)
-    )
-
-    for i, frame in enumerate(frames):
-        # Create a copy of the frame for visualization
-        vis_frame = frame.copy()
-        
-        # Get motion boxes and viewport position for this frame
-        motion_boxes = motion_results[i] if i < len(motion_results) else []
-        vp_x, vp_y = viewport_positions[i] if i < len(viewport_positions) else (width//2, height//2)
-        
-        # Draw bounding boxes around motion regions (green color)
-        for x, y, w, h in motion_boxes:
-            cv2.rectangle(vis_frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-        
-        # Calculate viewport rectangle coordinates
-        vp_left = vp_x - vp_width // 2
-        vp_top = vp_y - vp_height // 2
-        vp_right = vp_x + vp_width // 2
-        vp_bottom = vp_y + vp_height // 2
-        
-        # Ensure viewport coordinates are within frame bounds
-        vp_left = max(0, vp_left)
-        vp_top = max(0, vp_top)
-        vp_right = min(width, vp_right)
-        vp_bottom = min(height, vp_bottom)
-        
-        # Draw the viewport rectangle (blue color)
-        cv2.rectangle(vis_frame, (vp_left, vp_top), (vp_right, vp_bottom), (255, 0, 0), 3)
-        
-        # Extract the viewport content
-        viewport_frame = frame[vp_top:vp_bottom, vp_left:vp_right]
-        
-        # Resize viewport to exact viewport size if needed
-        if viewport_frame.shape[:2] != (vp_height, vp_width):
-            viewport_frame = cv2.resize(viewport_frame, (vp_width, vp_height))
-        
-        # Add frame number to the visualization
-        cv2.putText(vis_frame, f"Frame {i+1}/{len(frames)}", 
-                   (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-        cv2.putText(viewport_frame, f"Frame {i+1}", 
-                   (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-        
-        # Save visualization frames as images
-        frame_filename = os.path.join(frames_dir, f"frame_{i+1:04d}.jpg")
-        cv2.imwrite(frame_filename, vis_frame)
-        
-        viewport_filename = os.path.join(viewport_dir, f"viewport_{i+1:04d}.jpg")
-        cv2.imwrite(viewport_filename, viewport_frame)
-        
-        # Write frames to both video writers
-        video_writer.write(vis_frame)
-        viewport_writer.write(viewport_frame)
-    
-    # Release the video writers
-    video_writer.release()
-    viewport_writer.release()
+
+    # Writers and their threads are created from the first frame
+    video_writers = []
+    writer_threads = []
+
+    try:
+        for i, (frame, motion_boxes, (vp_x, vp_y)) in enumerate(
+            zip(frames, motion_results, viewport_positions)
+        ):
+            if not video_writers:
+                # Get dimensions for the output video from the first frame
+                height, width = frame.shape[:2]
+                if vp_width > width or vp_height > height:
+                    raise ValueError(
+                        f"Viewport {vp_width}x{vp_height} does not fit in {width}x{height} frames"
+                    )
+
+                # Largest top-left corner that keeps the viewport inside the frame
+                max_left = width - vp_width
+                max_top = height - vp_height
+
+                # Reuse a ring of drawing buffers instead of allocating a copy of
+                # every frame. A buffer can be waiting in the queue or being
+                # encoded while the next ones are drawn, hence prefetch + 2.
+                vis_buffers = [np.empty_like(frame) for _ in range(prefetch + 2)]
+
+                # Create video writers, each encoding on its own thread so
+                # drawing the next frame overlaps with writing the previous ones
+                for path, size in [(video_path, (width, height)),
+                                   (viewport_video_path, (vp_width, vp_height))]:
+                    video_writers.append(_open_video_writer(path, 5, size, codec))
+                    writer_threads.append(_WriterThread(video_writers[-1], prefetch))
+                video_thread, viewport_thread = writer_threads
+
+            # Copy the frame into the next free buffer for visualization
+            vis_frame = vis_buffers[i % len(vis_buffers)]
+            np.copyto(vis_frame, frame)
+            
+            # Draw bounding boxes around motion regions (green color)
+            for x, y, w, h in motion_boxes:
+                cv2.rectangle(vis_frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+            
+            # Calculate viewport rectangle coordinates, shifting the viewport
+            # rather than shrinking it so it always has the exact viewport size
+            vp_left = vp_x - vp_width // 2
+            vp_top = vp_y - vp_height // 2
+            if vp_left < 0:
+                vp_left = 0
+            elif vp_left > max_left:
+                vp_left = max_left
+            if vp_top < 0:
+                vp_top = 0
+            elif vp_top > max_top:
+                vp_top = max_top
+            vp_right = vp_left + vp_width
+            vp_bottom = vp_top + vp_height
+            
+            # Draw the viewport rectangle (blue color)
+            cv2.rectangle(vis_frame, (vp_left, vp_top), (vp_right, vp_bottom), (255, 0, 0), 3)
+            
+            # Extract the viewport content
+            viewport_frame = frame[vp_top:vp_bottom, vp_left:vp_right]
+            
+            # Add frame number to the visualization
+            cv2.putText(vis_frame, f"Frame {i+1}", 
+                       (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+            cv2.putText(viewport_frame, f"Frame {i+1}", 
+                       (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+            
+            # Optionally save visualization frames as images
+            frame_filename = None
+            viewport_filename = None
+            if save_frames:
+                frame_filename = os.path.join(frames_dir, f"frame_{i+1:04d}.jpg")
+                viewport_filename = os.path.join(viewport_dir, f"viewport_{i+1:04d}.jpg")
+            
+            # Hand frames to both writer threads
+            video_thread.put(vis_frame, frame_filename)
+            viewport_thread.put(viewport_frame, viewport_filename)
+    finally:
+        # Flush the writer threads and release the video writers, also when
+        # drawing or writing failed, so no thread or ffmpeg process is left
+        # running. Release errors are kept until the writers are all closed.
+        for writer_thread in writer_threads:
+            writer_thread.close()
+        release_errors = []
+        for video_writer in video_writers:
+            try:
+                video_writer.release()
+            except Exception as exc:
+                release_errors.append(exc)
+
+    # Surface errors from the writer threads, then from closing the writers
+    for writer_thread in writer_threads:
+        writer_thread.check()
+    if release_errors:
+        raise release_errors[0]
+
+    if not video_writers:
+        print("No frames to visualize")
+        return
 
     print(f"Visualization saved to {video_path}")
     print(f"Viewport video saved to {viewport_video_path}")
-    print(f"Individual frames saved to {frames_dir} and {viewport_dir}")
\ No newline at end of file
+    if save_frames:
+        print(f"Individual frames saved to {frames_dir} and {viewport_dir}")